@@ -0,0 +1,173 @@
+import csv
+import mimetypes
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
+from werkzeug.datastructures import FileStorage
+
+from images import DEFAULT_MAX_UPLOAD_MB, store_upload
+from participants import search_fields
+from stats import NOT_ENTERED
+
+DEFAULT_MAX_IMPORT_MB = 2048
+IMPORT_BATCH_SIZE = 500
+IMPORT_WORKERS = 8
+REQUIRED_COLUMNS = ("name", "email")
+DUPLICATE_KEY = 11000
+
+
+def read_rows(text_stream):
+    """
+    Yield (line_number, row) from a CSV file with lower-cased, trimmed headers.
+
+    Raises ValueError if a required column is missing.
+    """
+    reader = csv.DictReader(text_stream)
+    columns = [(column or "").strip().lower() for column in reader.fieldnames or []]
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    reader.fieldnames = columns
+    for row in reader:
+        yield reader.line_num, {
+            column: (value or "").strip() for column, value in row.items() if column
+        }
+
+
+def photo_index(archive):
+    """
+    Map each photo's file name, with and without folders, to its ZIP member.
+    """
+    members = {}
+    for info in archive.infolist():
+        if info.is_dir():
+            continue
+        members.setdefault(info.filename, info.filename)
+        members.setdefault(os.path.basename(info.filename), info.filename)
+    return members
+
+
+def _store_photo(fs, hashes, archive, member):
+    # Streamed from the archive; ZIP members are seekable, as store_upload needs
+    with archive.open(member) as stream:
+        file = FileStorage(
+            stream=stream,
+            filename=os.path.basename(member),
+            content_type=mimetypes.guess_type(member)[0] or "application/octet-stream",
+        )
+        image_fields, _ = store_upload(fs, hashes, file)
+    return image_fields
+
+
+def _build_participant(row, photo):
+    image_fields = photo.result() if photo else {"image_id": None}
+    return {
+        "_id": ObjectId(),
+        **image_fields,
+        "name": row["name"],
+        "email": row["email"],
+        "phone": row.get("phone", ""),
+        **search_fields(row["name"], row["email"], row.get("phone")),
+        "status": NOT_ENTERED,
+        "updated_at": datetime.now(timezone.utc),
+    }
+
+
+def _insert_batch(collection, batch):
+    """
+    Insert one batch of (line_number, participant) and return the rows that failed.
+    """
+    failed = {}
+    try:
+        collection.insert_many([participant for _, participant in batch], ordered=False)
+    except BulkWriteError as e:
+        for error in e.details["writeErrors"]:
+            line_number, _ = batch[error["index"]]
+            message = (
+                "Email already registered"
+                if error["code"] == DUPLICATE_KEY
+                else error.get("errmsg", "Insert failed")
+            )
+            # Photos are kept: they are deduplicated, so a retry reuses them
+            failed[error["index"]] = {"row": line_number, "error": message}
+    return failed
+
+
+def import_participants(collection, fs, hashes, rows, archive=None,
+                        batch_size=IMPORT_BATCH_SIZE, workers=IMPORT_WORKERS,
+                        max_photo_bytes=DEFAULT_MAX_UPLOAD_MB * 1024 * 1024):
+    """
+    Register participants from (line_number, row) pairs, e.g. from read_rows().
+
+    Rows need a name and an email; an optional phone, and an optional photo
+    naming a file of at most `max_photo_bytes` in the `archive` ZIP. Photos
+    are streamed into GridFS by a pool of threads, and each batch of
+    participants goes in with one unordered insert_many. QR codes are left
+    to be rendered on first view.
+
+    Yields {"inserted": [participants], "errors": [{"row", "error"}]} per batch.
+    """
+    members = photo_index(archive) if archive else {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # A photo shared by several rows is stored once
+        photos = {}
+        pending, errors = [], []
+        try:
+            for line_number, row in rows:
+                if not row.get("name") or not row.get("email"):
+                    errors.append({"row": line_number, "error": "Name and email are required"})
+                    continue
+                photo = None
+                if row.get("photo"):
+                    member = members.get(row["photo"])
+                    if member is None:
+                        errors.append({"row": line_number, "error": f"Photo not found: {row['photo']}"})
+                        continue
+                    if archive.getinfo(member).file_size > max_photo_bytes:
+                        errors.append({"row": line_number, "error": f"Photo too large: {row['photo']}"})
+                        continue
+                    if member not in photos:
+                        # Submitted ahead of every row that waits on it, so a
+                        # worker never waits on a task still queued behind it
+                        photos[member] = pool.submit(_store_photo, fs, hashes, archive, member)
+                    photo = photos[member]
+                pending.append((line_number, pool.submit(_build_participant, row, photo)))
+                if len(pending) >= batch_size:
+                    yield _finish_batch(collection, pending, errors)
+                    pending, errors = [], []
+        except (ValueError, UnicodeDecodeError, csv.Error):
+            # The file became unreadable; rows read before that still go in
+            if pending or errors:
+                yield _finish_batch(collection, pending, errors)
+            raise
+        if pending or errors:
+            yield _finish_batch(collection, pending, errors)
+
+
+def _finish_batch(collection, pending, errors):
+    batch = []
+    for line_number, future in pending:
+        try:
+            batch.append((line_number, future.result()))
+        except Exception as e:
+            errors.append({"row": line_number, "error": f"Could not store files: {e}"})
+    failed = _insert_batch(collection, batch) if batch else {}
+    errors.extend(failed.values())
+    inserted = [
+        participant for index, (_, participant) in enumerate(batch) if index not in failed
+    ]
+    return {"inserted": inserted, "errors": sorted(errors, key=lambda error: error["row"])}
+
+
+def open_archive(file):
+    """
+    Open a ZIP of photos, raising ValueError if it is not a valid archive.
+    """
+    try:
+        return zipfile.ZipFile(file)
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"Invalid photo archive: {e}")
@@ -0,0 +1,267 @@
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+DEFAULT_IMAGE_CACHE_MB = 64
+DEFAULT_DISK_CACHE_MB = 1024
+DEFAULT_LOCATION_CACHE_SIZE = 50000
+DEFAULT_LOCATION_CACHE_TTL = 600
+# Eviction trims the disk cache to this fraction of its limit, so that
+# the directory walk is not repeated on every write once it is full
+DISK_CACHE_LOW_WATER = 0.9
+
+CachedImage = namedtuple("CachedImage", ["data", "content_type"])
+
+
+class ImageCache:
+    """
+    In-process LRU cache of image bytes, bounded by their total size.
+
+    Items larger than `max_item_bytes` are never cached so that a single
+    large photo cannot flush the small, frequently viewed ones.
+    """
+
+    def __init__(self, max_bytes, max_item_bytes=None):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes if max_item_bytes is not None else max_bytes // 8
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def accepts(self, length):
+        return 0 < length <= self.max_item_bytes
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item
+
+    def put(self, key, data, content_type):
+        item = CachedImage(data, content_type)
+        if not self.accepts(len(data)):
+            return item
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous.data)
+            self._items[key] = item
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted.data)
+                self.evictions += 1
+        return item
+
+    def stats(self):
+        with self._lock:
+            return {
+                "items": len(self._items),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class LocationCache:
+    """
+    Small LRU of participant -> photo location lookups, with a time-to-live.
+
+    Photos are immutable, so entries only go stale when a participant is
+    removed; the TTL bounds how long other workers can miss that.
+    """
+
+    def __init__(self, max_items, ttl):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._items.pop(key, None)
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "items": len(self._items),
+                "max_items": self.max_items,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class DiskImageCache:
+    """
+    Local directory cache of image files, shared by every worker on the host.
+
+    File contents live under objects/ named by their SHA-256, so identical
+    images are stored once; by-id/<key> is a symlink to the content file.
+    Reads bump the file's mtime, and eviction drops the least recently used
+    files once the directory grows past `max_bytes`. The running total is
+    kept in a size file guarded by flock, so every worker sees the others'
+    writes.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._objects = os.path.join(directory, "objects")
+        self._links = os.path.join(directory, "by-id")
+        self._size_path = os.path.join(directory, "size")
+        self._lock_path = os.path.join(directory, "size.lock")
+        os.makedirs(self._objects, exist_ok=True)
+        os.makedirs(self._links, exist_ok=True)
+        with self._locked():
+            if self._read_size() is None:
+                self._write_size(sum(size for _, _, size in self._content_files()))
+        self.hits = self.misses = self.evictions = 0
+
+    def accepts(self, length):
+        return 0 < length <= self.max_bytes // 8
+
+    def _locked(self):
+        lock_file = open(self._lock_path, "a")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file  # Closing it releases the lock
+
+    def _read_size(self):
+        try:
+            with open(self._size_path) as size_file:
+                return int(size_file.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_size(self, size):
+        temp_path = f"{self._size_path}.{os.getpid()}"
+        with open(temp_path, "w") as size_file:
+            size_file.write(str(size))
+        os.replace(temp_path, self._size_path)
+
+    def _add_size(self, delta):
+        with self._locked():
+            size = (self._read_size() or 0) + delta
+            self._write_size(size)
+            return size
+
+    def _content_files(self):
+        for root, _, names in os.walk(self._objects):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    info = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, info.st_mtime, info.st_size
+
+    def get(self, key):
+        """
+        Return the path of the cached file for `key`, or None on a miss.
+        """
+        link = os.path.join(self._links, str(key))
+        try:
+            os.utime(link)  # Follows the symlink, marking the content as recently used
+        except FileNotFoundError:
+            self.misses += 1
+            if os.path.islink(link):
+                os.unlink(link)  # Content was evicted
+            return None
+        self.hits += 1
+        return link
+
+    def put(self, key, chunks):
+        """
+        Write an iterable of byte chunks to the cache and return its path.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as temp:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    temp.write(chunk)
+                    size += len(chunk)
+            name = digest.hexdigest()
+            content_dir = os.path.join(self._objects, name[:2])
+            os.makedirs(content_dir, exist_ok=True)
+            content_path = os.path.join(content_dir, name)
+            try:
+                os.utime(content_path)
+                os.unlink(temp_path)
+                size = 0  # Already stored and counted
+            except FileNotFoundError:
+                os.replace(temp_path, content_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+        # Swap the link in atomically so readers never see a missing file
+        link = os.path.join(self._links, str(key))
+        temp_link = f"{link}.{os.getpid()}.{threading.get_ident()}"
+        os.symlink(os.path.relpath(content_path, self._links), temp_link)
+        os.replace(temp_link, link)
+
+        if size and self._add_size(size) > self.max_bytes:
+            self._evict()
+        return link
+
+    def _evict(self):
+        with self._locked():
+            # Recount from disk: the size file is only as good as every
+            # worker's bookkeeping, and this is the moment it matters
+            files = sorted(self._content_files(), key=lambda entry: entry[1])
+            size = sum(file_size for _, _, file_size in files)
+            target = self.max_bytes * DISK_CACHE_LOW_WATER
+            for path, _, file_size in files:
+                if size <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                size -= file_size
+                self.evictions += 1
+            self._write_size(size)
+
+    def stats(self):
+        return {
+            "bytes": self._read_size(),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
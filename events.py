@@ -0,0 +1,185 @@
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from participants import LISTING_FIELDS, find_participants, serialize_participant
+
+POLL_INTERVAL = 2
+SUBSCRIBER_QUEUE_SIZE = 1000
+RETRY_DELAY = 5
+# Tolerates clock skew between the workers stamping updated_at
+CLOCK_SKEW = timedelta(seconds=5)
+
+
+class Subscriber:
+    """
+    One connected client's queue of (event, data) messages.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def send(self, event, data):
+        try:
+            self.queue.put_nowait((event, data))
+        except queue.Full:
+            # The client fell too far behind to patch up; tell it to reload
+            self.overflowed = True
+
+    def next(self, timeout):
+        if self.overflowed:
+            return "resync", None
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class ParticipantEvents:
+    """
+    Fans participant changes out to every subscriber in this worker.
+
+    A single background thread tails a change stream on the participants
+    and counters collections, or polls them when change streams are
+    unavailable (for example on a standalone server). It runs only while
+    someone listens. Counters are pushed from their own writes, which land
+    after the participant write they follow.
+    """
+
+    def __init__(self, collection, stats_collection, read_stats, poll_interval=POLL_INTERVAL):
+        self.collection = collection
+        self.stats_collection = stats_collection
+        self.read_stats = read_stats
+        self.poll_interval = poll_interval
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self):
+        subscriber = Subscriber()
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _listening(self):
+        with self._lock:
+            return bool(self._subscribers)
+
+    def _publish(self, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.send(event, data)
+
+    def _publish_participant(self, participant):
+        self._publish(
+            "participant",
+            {"op": "upsert", "participant": serialize_participant(participant)},
+        )
+
+    def _publish_stats(self):
+        self._publish("stats", self.read_stats())
+
+    def _run(self):
+        use_change_stream = True
+        try:
+            while True:
+                with self._lock:
+                    if not self._subscribers:
+                        # Decided under the lock, so subscribe() starts a new thread
+                        self._thread = None
+                        return
+                try:
+                    if use_change_stream:
+                        self._tail_change_stream()
+                    else:
+                        self._poll()
+                except OperationFailure:
+                    # Change streams need a replica set; fall back to polling
+                    use_change_stream = False
+                except PyMongoError:
+                    time.sleep(RETRY_DELAY)
+        finally:
+            # Let the next subscriber start a fresh thread if this one crashed
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+
+    def _tail_change_stream(self):
+        pipeline = [
+            {
+                "$match": {
+                    "ns.coll": {"$in": [self.collection.name, self.stats_collection.name]},
+                    "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+                }
+            },
+            {
+                "$project": {
+                    "ns": 1,
+                    "operationType": 1,
+                    "documentKey": 1,
+                    **{f"fullDocument.{field}": 1 for field in LISTING_FIELDS},
+                }
+            },
+        ]
+        with self.collection.database.watch(
+            pipeline, full_document="updateLookup", max_await_time_ms=1000
+        ) as stream:
+            while self._listening():
+                change = stream.try_next()
+                if change is None:
+                    continue
+                if change["ns"]["coll"] == self.stats_collection.name:
+                    self._publish_stats()
+                elif change["operationType"] == "delete":
+                    self._publish(
+                        "participant",
+                        {"op": "delete", "_id": str(change["documentKey"]["_id"])},
+                    )
+                elif change.get("fullDocument"):
+                    self._publish_participant(change["fullDocument"])
+                # Otherwise it was deleted before the lookup; its delete event follows
+
+    def _poll(self):
+        last_seen = datetime.now(timezone.utc).replace(tzinfo=None)
+        last_stats = self.read_stats()
+        # Rows inside the skew window come back on every poll; send them once
+        published = {}
+        while self._listening():
+            time.sleep(self.poll_interval)
+            since = last_seen - CLOCK_SKEW
+            query = {"updated_at": {"$gt": since}}
+            changed = [
+                participant
+                for participant in find_participants(
+                    self.collection, query, LISTING_FIELDS + ("updated_at",)
+                ).sort("updated_at", 1)
+                if published.get(participant["_id"]) != participant["updated_at"]
+            ]
+            published = {
+                participant_id: updated_at
+                for participant_id, updated_at in published.items()
+                if updated_at > since
+            }
+            for participant in changed:
+                self._publish_participant(participant)
+                published[participant["_id"]] = participant["updated_at"]
+            if changed:
+                last_seen = max(last_seen, changed[-1]["updated_at"].replace(tzinfo=None))
+            # Compared on every poll, so a counter write that lands after
+            # its participant write still goes out
+            stats = self.read_stats()
+            if stats != last_stats:
+                self._publish("stats", stats)
+                last_stats = stats
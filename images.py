@@ -0,0 +1,343 @@
+import hashlib
+import io
+import mimetypes
+import time
+
+import qrcode
+from gridfs.errors import FileExists, NoFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+DEFAULT_MAX_UPLOAD_MB = 10
+MIGRATION_BATCH_SIZE = 100
+HASH_READ_SIZE = 255 * 1024  # GridFS default chunk size
+
+# Renditions served through /image/<participant_id>?size=<name>, by longest edge.
+# The dashboard shows photos at 80x80 CSS pixels, so "thumb" covers 2x screens.
+THUMBNAIL_SIZES = {"thumb": 160}
+THUMBNAIL_FORMAT = "WEBP"
+THUMBNAIL_CONTENT_TYPE = "image/webp"
+
+# Stored photos are never modified, so clients may keep them for a year
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# For responses that change once thumbnails are generated
+PROVISIONAL_CACHE_CONTROL = "public, max-age=300"
+# Upper bound on the image bytes inlined into one /images response
+MAX_BATCH_BYTES = 4 * 1024 * 1024
+
+
+def hash_stream(stream):
+    """
+    SHA-256 of a seekable stream, read in chunks and rewound afterwards.
+    """
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(HASH_READ_SIZE), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def _stored_image_fields(record, filename):
+    return {
+        "image_id": record["image_id"],
+        "image_sha256": record["_id"],
+        "filename": filename,
+        "content_type": record["content_type"],
+        "length": record["length"],
+        "thumbnails": record["thumbnails"],
+    }
+
+
+def store_upload(fs, hashes, file):
+    """
+    Store an uploaded werkzeug FileStorage and its thumbnails in GridFS.
+
+    `hashes` maps each photo's SHA-256 (its _id) to the GridFS files holding
+    it, so a photo that was already uploaded is reused instead of written
+    again. New uploads are streamed into GridFS in chunk-sized reads and are
+    never held in memory as a whole.
+
+    Returns (fields to store on the participant, whether new files were written).
+    """
+    # werkzeug has already spooled the upload locally, so hashing it first
+    # is cheap and lets duplicates skip the GridFS write entirely
+    sha256 = hash_stream(file.stream)
+    existing = hashes.find_one({"_id": sha256})
+    if existing:
+        return _stored_image_fields(existing, file.filename), False
+
+    grid_in = fs.new_file(
+        filename=file.filename, content_type=file.mimetype, metadata={"sha256": sha256}
+    )
+    try:
+        grid_in.write(file.stream)
+    except Exception:
+        grid_in.abort()
+        raise
+    grid_in.close()
+    file.stream.seek(0)
+
+    record = {
+        "_id": sha256,
+        "image_id": grid_in._id,
+        "content_type": file.mimetype,
+        "length": grid_in.length,
+        "thumbnails": {},
+    }
+    try:
+        record["thumbnails"] = create_thumbnails(fs, file.stream, file.filename)
+        hashes.insert_one(record)
+    except DuplicateKeyError:
+        # The same photo was stored concurrently; keep that copy instead
+        delete_image_files(fs, record)
+        existing = hashes.find_one({"_id": sha256})
+        return _stored_image_fields(existing, file.filename), False
+    except Exception:
+        # Nothing refers to the new files yet, so they would be orphaned
+        delete_image_files(fs, record)
+        raise
+
+    return _stored_image_fields(record, file.filename), True
+
+
+def discard_upload(fs, hashes, image_fields):
+    """
+    Undo a store_upload() that wrote new files, e.g. when the participant insert fails.
+    """
+    hashes.delete_one({"_id": image_fields["image_sha256"]})
+    delete_image_files(fs, image_fields)
+
+
+def create_thumbnails(fs, source, filename):
+    """
+    Render every thumbnail size of an image file into GridFS.
+
+    Returns {size_name: file_id}, or an empty dict if the source is not an
+    image Pillow can read or is too large to decode.
+    """
+    try:
+        image = Image.open(source)
+        # Let JPEG decode straight at a reduced scale instead of full size
+        image.draft("RGB", (max(THUMBNAIL_SIZES.values()),) * 2)
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        # Includes images too large to decode safely
+        return {}
+
+    thumbnails = {}
+    try:
+        for name, size in THUMBNAIL_SIZES.items():
+            rendition = image.copy()
+            rendition.thumbnail((size, size))
+            buffer = io.BytesIO()
+            rendition.save(buffer, THUMBNAIL_FORMAT, quality=80)
+            thumbnails[name] = fs.put(
+                buffer.getvalue(),
+                filename=f"{name}_{filename}",
+                content_type=THUMBNAIL_CONTENT_TYPE,
+            )
+    except Exception:
+        for file_id in thumbnails.values():
+            fs.delete(file_id)
+        raise
+    return thumbnails
+
+
+def create_qr_code(fs, participant_id):
+    """
+    Render a PNG QR code of the participant id into GridFS and return its file id.
+    """
+    buffer = io.BytesIO()
+    qrcode.make(str(participant_id), box_size=8, border=2).save(buffer, "PNG")
+    return fs.put(
+        buffer.getvalue(), filename=f"qr_{participant_id}.png", content_type="image/png"
+    )
+
+
+def delete_image_files(fs, image_fields):
+    """
+    Remove a stored photo and its thumbnails from GridFS.
+    """
+    fs.delete(image_fields["image_id"])
+    for file_id in image_fields.get("thumbnails", {}).values():
+        fs.delete(file_id)
+
+
+def backfill_thumbnails(collection, fs):
+    """
+    Generate thumbnails for participants whose photo predates them.
+
+    Yields (participant_id, created) for every participant processed.
+    """
+    query = {"image_id": {"$ne": None}, "thumbnails": {"$exists": False}}
+    for participant in collection.find(query, {"image_id": 1, "filename": 1}):
+        try:
+            grid_out = fs.get(participant["image_id"])
+        except NoFile:
+            yield participant["_id"], False
+            continue
+        try:
+            thumbnails = create_thumbnails(
+                fs, grid_out, participant.get("filename") or grid_out.filename
+            )
+        finally:
+            grid_out.close()
+        # Record unreadable images too, so they are not retried on every run
+        collection.update_one(
+            {"_id": participant["_id"]}, {"$set": {"thumbnails": thumbnails}}
+        )
+        yield participant["_id"], bool(thumbnails)
+
+
+def image_etag(image_id):
+    """
+    Strong ETag for a stored photo; GridFS files are immutable, so the id suffices.
+    """
+    return str(image_id)
+
+
+def image_mimetype(content_type, filename=None):
+    """
+    Pick the recorded content type, falling back to a guess from the filename.
+    """
+    return (
+        content_type
+        or mimetypes.guess_type(filename or "")[0]
+        or "application/octet-stream"
+    )
+
+
+def select_rendition(participant, size=None):
+    """
+    Return (file_id, mimetype) of the participant's photo at the given size.
+
+    Falls back to the original until a thumbnail has been generated.
+    """
+    thumbnail_id = (participant.get("thumbnails") or {}).get(size)
+    if thumbnail_id:
+        return thumbnail_id, THUMBNAIL_CONTENT_TYPE
+    return participant["image_id"], image_mimetype(
+        participant.get("content_type"), participant.get("filename")
+    )
+
+
+def file_lengths(files_collection, file_ids):
+    """
+    Return {file_id: length} for the given GridFS files with one query.
+    """
+    return {
+        document["_id"]: document["length"]
+        for document in files_collection.find({"_id": {"$in": list(file_ids)}}, {"length": 1})
+    }
+
+
+def read_files(chunks_collection, file_ids):
+    """
+    Read several whole GridFS files with one query on the chunks collection.
+
+    Meant for small files such as thumbnails; returns {file_id: bytes}.
+    """
+    parts = {}
+    cursor = chunks_collection.find(
+        {"files_id": {"$in": list(file_ids)}}, {"files_id": 1, "n": 1, "data": 1}
+    ).sort([("files_id", ASCENDING), ("n", ASCENDING)])
+    for chunk in cursor:
+        parts.setdefault(chunk["files_id"], []).append(chunk["data"])
+    return {file_id: b"".join(chunks) for file_id, chunks in parts.items()}
+
+
+def iter_grid_out(grid_out, start, stop):
+    """
+    Yield the bytes of a GridFS file in [start, stop), one chunk at a time.
+    """
+    grid_out.seek(start)
+    remaining = stop - start
+    try:
+        while remaining > 0:
+            data = grid_out.read(min(grid_out.chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        grid_out.close()
+
+
+def _put_migrated_file(fs, file_id, data, filename, content_type):
+    try:
+        fs.put(data, _id=file_id, filename=filename, content_type=content_type)
+    except FileExists:
+        if fs.exists(file_id):
+            return  # Written by an earlier, interrupted run
+        # That run died after the chunks but before the files document;
+        # clear the orphan chunks and write the file again
+        fs.delete(file_id)
+        fs.put(data, _id=file_id, filename=filename, content_type=content_type)
+
+
+def migrate_inline_images(collection, fs, batch_size=MIGRATION_BATCH_SIZE):
+    """
+    Move image bytes stored inline in `data` into GridFS, one batch at a time.
+
+    Each GridFS file reuses its participant's _id, so re-running after an
+    interruption picks up where it stopped without writing a file twice.
+    Yields a progress dict after every batch.
+    """
+    started = time.monotonic()
+    migrated = failed = migrated_bytes = 0
+    last_id = None
+
+    while True:
+        query = {"data": {"$exists": True}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = list(
+            collection.find(query, {"data": 1, "filename": 1})
+            .sort("_id", ASCENDING)
+            .limit(batch_size)
+        )
+        if not batch:
+            break
+
+        updates = []
+        for document in batch:
+            data = document["data"]
+            filename = document.get("filename") or str(document["_id"])
+            content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            try:
+                _put_migrated_file(fs, document["_id"], data, filename, content_type)
+            except Exception:
+                failed += 1
+                continue
+            if not fs.exists(document["_id"]):
+                # Never drop the inline bytes without a complete GridFS file
+                failed += 1
+                continue
+            updates.append(
+                UpdateOne(
+                    {"_id": document["_id"]},
+                    {
+                        "$set": {
+                            "image_id": document["_id"],
+                            "content_type": content_type,
+                            "length": len(data),
+                        },
+                        "$unset": {"data": ""},
+                    },
+                )
+            )
+            migrated_bytes += len(data)
+
+        if updates:
+            migrated += collection.bulk_write(updates, ordered=False).modified_count
+        last_id = batch[-1]["_id"]
+
+        elapsed = time.monotonic() - started
+        yield {
+            "migrated": migrated,
+            "failed": failed,
+            "bytes": migrated_bytes,
+            "elapsed": elapsed,
+            "docs_per_second": migrated / elapsed if elapsed else 0.0,
+        }
@@ -0,0 +1,122 @@
+import threading
+import time
+
+from pymongo import ASCENDING, TEXT, IndexModel, UpdateOne
+from pymongo.errors import OperationFailure
+
+from participants import search_fields
+
+# Indexes the app relies on for status counts, lookups and incremental sync.
+PARTICIPANT_INDEXES = [
+    IndexModel([("status", ASCENDING)], name="status_1"),
+    IndexModel([("email", ASCENDING)], name="email_1", unique=True),
+    IndexModel([("phone_normalized", ASCENDING)], name="phone_normalized_1"),
+    IndexModel([("name", ASCENDING)], name="name_1"),
+    IndexModel([("updated_at", ASCENDING)], name="updated_at_1"),
+    IndexModel([("name_lower", ASCENDING)], name="name_lower_1"),
+    IndexModel([("email_lower", ASCENDING)], name="email_lower_1"),
+    IndexModel(
+        [("name", TEXT), ("email", TEXT)],
+        name="search_text",
+        default_language="none",  # Names should not be stemmed
+    ),
+]
+
+BACKFILL_BATCH_SIZE = 1000
+INDEX_CHECK_INTERVAL = 60
+
+
+def ensure_indexes(collection, indexes=PARTICIPANT_INDEXES):
+    """
+    Create every declared index, returning {name: error} for those that failed.
+
+    Indexes are created one at a time so that a single failure (for example
+    duplicate emails blocking the unique index) does not stop the rest.
+    """
+    errors = {}
+    for index in indexes:
+        name = index.document["name"]
+        try:
+            collection.create_indexes([index])
+        except OperationFailure as e:
+            errors[name] = str(e)
+    return errors
+
+
+def index_report(collection, indexes=PARTICIPANT_INDEXES):
+    """
+    Compare the declared indexes with the ones present on the collection.
+
+    Returns the names of missing indexes, indexes that exist but are not
+    declared, and indexes with no recorded use since the server started.
+    """
+    declared = {index.document["name"] for index in indexes}
+    existing = set(collection.index_information()) - {"_id_"}
+
+    unused = []
+    try:
+        for usage in collection.aggregate([{"$indexStats": {}}]):
+            if usage["name"] != "_id_" and usage["accesses"]["ops"] == 0:
+                unused.append(usage["name"])
+    except OperationFailure:
+        # $indexStats needs clusterMonitor privileges; skip usage reporting
+        unused = None
+
+    return {
+        "missing": sorted(declared - existing),
+        "undeclared": sorted(existing - declared),
+        "unused": sorted(unused) if unused is not None else None,
+    }
+
+
+class IndexCheck:
+    """
+    Whether an index exists, re-checked at most every `interval` seconds.
+    """
+
+    def __init__(self, collection, name, interval=INDEX_CHECK_INTERVAL):
+        self.collection = collection
+        self.name = name
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._exists = False
+
+    def __call__(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._checked_at is None or now - self._checked_at > self.interval:
+                try:
+                    self._exists = self.name in self.collection.index_information()
+                except OperationFailure:
+                    self._exists = False
+                self._checked_at = now
+            return self._exists
+
+
+def backfill_indexed_fields(collection, now, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Fill in search fields and updated_at on documents written before they existed.
+    """
+    query = {
+        "$or": [
+            {field: {"$exists": False}}
+            for field in ("name_lower", "email_lower", "phone_normalized", "updated_at")
+        ]
+    }
+    updated = 0
+    batch = []
+    projection = {"name": 1, "email": 1, "phone": 1, "updated_at": 1}
+    for document in collection.find(query, projection):
+        fields = search_fields(
+            document.get("name"), document.get("email"), document.get("phone")
+        )
+        if "updated_at" not in document:
+            fields["updated_at"] = now
+        batch.append(UpdateOne({"_id": document["_id"]}, {"$set": fields}))
+        if len(batch) >= batch_size:
+            updated += collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += collection.bulk_write(batch, ordered=False).modified_count
+    return updated
@@ -0,0 +1,133 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+DEFAULT_LOG_LEVEL = "INFO"
+# Busy, low-value routes can be sampled down with LOG_SAMPLE_RATES,
+# e.g. "get_image=0.01,get_images_batch=0.1"
+DEFAULT_SAMPLE_RATE = 1.0
+LOG_QUEUE_SIZE = 10000
+
+# LogRecord attributes that are not caller-supplied fields
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, with any `extra=` fields inlined.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestSampler(logging.Filter):
+    """
+    Drop below-WARNING records from requests that were not sampled.
+
+    The decision is made once per request, so a sampled request keeps all
+    of its records and an unsampled one costs a single attribute lookup.
+    """
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not has_request_context():
+            return True
+        return g.get("log_sampled", True)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass  # Never block a request on a slow log sink
+
+
+def parse_sample_rates(value):
+    """
+    Turn "endpoint=rate,..." into {endpoint: rate}, ignoring malformed entries.
+    """
+    rates = {}
+    for item in (value or "").split(","):
+        endpoint, _, rate = item.partition("=")
+        try:
+            rates[endpoint.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            continue
+    return rates
+
+
+def configure_logging(app, level=None, json_output=True, sample_rates=None,
+                      default_rate=DEFAULT_SAMPLE_RATE):
+    """
+    Route every log record through a queue to a background writer thread.
+
+    Request handlers only pay for building the record; formatting and the
+    write to stderr happen on the listener thread. Each request logs one
+    access line with its endpoint, status and duration, sampled per endpoint.
+    """
+    level = level or DEFAULT_LOG_LEVEL
+    sample_rates = sample_rates or {}
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(
+        JsonFormatter()
+        if json_output
+        else logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    handler = _DroppingQueueHandler(log_queue)
+    handler.addFilter(RequestSampler())
+    listener = logging.handlers.QueueListener(log_queue, output)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    app.logger.removeHandler(default_handler)
+    app.logger.setLevel(level)
+
+    @app.before_request
+    def start_request_log():
+        g.log_started = time.perf_counter()
+        rate = sample_rates.get(request.endpoint, default_rate)
+        g.log_sampled = rate >= 1.0 or random.random() < rate
+
+    @app.after_request
+    def write_request_log(response):
+        if g.get("log_sampled") and app.logger.isEnabledFor(logging.INFO):
+            app.logger.info(
+                "%s %s %s",
+                request.method,
+                request.path,
+                response.status_code,
+                extra={
+                    "endpoint": request.endpoint,
+                    "status": response.status_code,
+                    "duration_ms": round((time.perf_counter() - g.log_started) * 1000, 2),
+                },
+            )
+        return response
+
+    return listener
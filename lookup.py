@@ -0,0 +1,229 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta, timezone
+
+from participants import PHONE_QUERY, normalize_phone, normalize_text
+
+LOOKUP_FIELDS = ("name", "email", "phone", "status", "updated_at")
+DEFAULT_LOOKUP_LIMIT = 10
+# Writes made by other workers are pulled in through the updated_at index
+REFRESH_INTERVAL = 5
+# A full rebuild also drops participants deleted elsewhere
+REBUILD_INTERVAL = 600
+# Tolerates clock skew between the workers stamping updated_at
+CLOCK_SKEW = timedelta(seconds=5)
+
+
+class ParticipantLookup:
+    """
+    In-memory typeahead index over participant names, emails and phones.
+
+    Keys live in sorted arrays of (key, participant_id), so a prefix lookup
+    is a binary search followed by a short scan. Phone numbers are also
+    indexed reversed, which lets "the last few digits" match as a prefix.
+    """
+
+    def __init__(self, refresh_interval=REFRESH_INTERVAL, rebuild_interval=REBUILD_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.RLock()
+        self._clear()
+        self._built_at = None
+        self._first_build = threading.Lock()
+        # Set while a background refresh or rebuild is running
+        self._maintaining = False
+        # Bumped by clear(), so a rebuild that started before it is discarded
+        self._generation = 0
+
+    def _clear(self):
+        self._prefixes = []
+        self._suffixes = []
+        self._keys = {}
+        self._rows = {}
+        self._last_seen = None
+        self._refreshed_at = 0.0
+
+    def _entry_keys(self, participant):
+        name = normalize_text(participant.get("name"))
+        prefixes = {name, normalize_text(participant.get("email"))}
+        # Let "kumar" find "Ravi Kumar"
+        prefixes.update(name.split())
+        phone = normalize_phone(participant.get("phone"))
+        if phone:
+            prefixes.add(phone)
+        prefixes.discard("")
+        return prefixes, {phone[::-1]} if phone else set()
+
+    def _remove(self, participant_id):
+        prefixes, suffixes = self._keys.pop(participant_id, (set(), set()))
+        for keys, array in ((prefixes, self._prefixes), (suffixes, self._suffixes)):
+            for key in keys:
+                index = bisect_left(array, (key, participant_id))
+                if index < len(array) and array[index] == (key, participant_id):
+                    del array[index]
+        self._rows.pop(participant_id, None)
+
+    @staticmethod
+    def _row(participant_id, participant):
+        return {
+            "_id": participant_id,
+            "name": participant.get("name"),
+            "email": participant.get("email"),
+            "phone": participant.get("phone"),
+            "status": participant.get("status"),
+        }
+
+    @staticmethod
+    def _updated_at(participant):
+        updated_at = participant.get("updated_at")
+        if updated_at and updated_at.tzinfo:
+            # pymongo hands back naive UTC datetimes; compare like with like
+            updated_at = updated_at.astimezone(timezone.utc).replace(tzinfo=None)
+        return updated_at
+
+    def add(self, participant):
+        """
+        Insert or replace a participant in the index.
+        """
+        participant_id = str(participant["_id"])
+        with self._lock:
+            self._remove(participant_id)
+            prefixes, suffixes = self._entry_keys(participant)
+            for key in prefixes:
+                insort(self._prefixes, (key, participant_id))
+            for key in suffixes:
+                insort(self._suffixes, (key, participant_id))
+            self._keys[participant_id] = (prefixes, suffixes)
+            self._rows[participant_id] = self._row(participant_id, participant)
+            updated_at = self._updated_at(participant)
+            if updated_at and (self._last_seen is None or updated_at > self._last_seen):
+                self._last_seen = updated_at
+
+    def set_status(self, participant_id, status):
+        with self._lock:
+            row = self._rows.get(str(participant_id))
+            if row:
+                row["status"] = status
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+            self._built_at = time.monotonic()
+            self._generation += 1
+
+    def build(self, collection):
+        """
+        Rebuild the whole index from a projected scan of the collection.
+
+        The new arrays are filled in one pass and sorted once, without the
+        lock; searches keep using the old index until it is swapped in.
+        """
+        with self._lock:
+            generation = self._generation
+        started = datetime.now(timezone.utc).replace(tzinfo=None)
+        prefixes, suffixes, keys, rows = [], [], {}, {}
+        last_seen = None
+        projection = {field: 1 for field in LOOKUP_FIELDS}
+        for participant in collection.find({}, projection):
+            participant_id = str(participant["_id"])
+            entry_prefixes, entry_suffixes = self._entry_keys(participant)
+            prefixes.extend((key, participant_id) for key in entry_prefixes)
+            suffixes.extend((key, participant_id) for key in entry_suffixes)
+            keys[participant_id] = (entry_prefixes, entry_suffixes)
+            rows[participant_id] = self._row(participant_id, participant)
+            updated_at = self._updated_at(participant)
+            if updated_at and (last_seen is None or updated_at > last_seen):
+                last_seen = updated_at
+        prefixes.sort()
+        suffixes.sort()
+
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._prefixes, self._suffixes = prefixes, suffixes
+            self._keys, self._rows = keys, rows
+            # Writes made during the scan are pulled in by the next refresh
+            self._last_seen = min(last_seen or started, started)
+            self._built_at = time.monotonic()
+            self._refreshed_at = 0.0
+
+    def refresh(self, collection):
+        """
+        Pull in participants written since the last pull, e.g. by other workers.
+
+        The query runs without the lock; it is only held to apply the rows.
+        """
+        with self._lock:
+            generation = self._generation
+            last_seen = self._last_seen
+        query = {}
+        if last_seen is not None:
+            query["updated_at"] = {"$gte": last_seen - CLOCK_SKEW}
+        projection = {field: 1 for field in LOOKUP_FIELDS}
+        participants = list(collection.find(query, projection))
+        with self._lock:
+            if generation != self._generation:
+                return
+            for participant in participants:
+                self.add(participant)
+
+    def _maintain(self, collection, rebuild):
+        try:
+            if rebuild:
+                self.build(collection)
+            else:
+                self.refresh(collection)
+        finally:
+            with self._lock:
+                self._maintaining = False
+
+    def refresh_if_due(self, collection):
+        """
+        Build the index on first use, then keep it current with cheap
+        incremental pulls and an occasional full rebuild. Both run on a
+        background thread, so lookups never wait on the database.
+        """
+        if self._built_at is None:
+            # Nothing to serve yet, so the first build has to be waited for
+            with self._first_build:
+                if self._built_at is None:
+                    self.build(collection)
+        now = time.monotonic()
+        with self._lock:
+            if self._maintaining:
+                return
+            rebuild = now - self._built_at > self.rebuild_interval
+            if not rebuild and now - self._refreshed_at < self.refresh_interval:
+                return
+            self._maintaining = True
+            self._refreshed_at = now
+        threading.Thread(
+            target=self._maintain, args=(collection, rebuild), daemon=True
+        ).start()
+
+    def _scan(self, array, prefix, limit, found):
+        index = bisect_left(array, (prefix,))
+        while index < len(array) and len(found) < limit:
+            key, participant_id = array[index]
+            if not key.startswith(prefix):
+                break
+            found.setdefault(participant_id, None)
+            index += 1
+
+    def search(self, query, limit=DEFAULT_LOOKUP_LIMIT):
+        """
+        Return up to `limit` participants whose name, a word of their name,
+        email, or phone number starts with `query`, or whose phone ends with it.
+        """
+        term = normalize_text(query)
+        if not term:
+            return []
+        found = {}
+        with self._lock:
+            self._scan(self._prefixes, term, limit, found)
+            if PHONE_QUERY.fullmatch(term):
+                digits = normalize_phone(term)
+                self._scan(self._prefixes, digits, limit, found)
+                self._scan(self._suffixes, digits[::-1], limit, found)
+            return [dict(self._rows[participant_id]) for participant_id in found]
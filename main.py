@@ -1,16 +1,111 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for
-from pymongo import MongoClient
+from flask import Flask, Response, request, jsonify, render_template, redirect, url_for
+from flask import Request, send_file, stream_template
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
 import os
+import base64
+import csv
+import hashlib
+import io
+import json
+import click
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 from bson.objectid import ObjectId
-from flask import send_file
+from werkzeug.datastructures import ContentRange
 
 from gridfs import GridFS
+from bson.errors import InvalidId
+
+from bulk_import import (
+    DEFAULT_MAX_IMPORT_MB,
+    IMPORT_BATCH_SIZE,
+    IMPORT_WORKERS,
+    import_participants,
+    open_archive,
+    read_rows,
+)
+from cache import (
+    DEFAULT_DISK_CACHE_MB,
+    DEFAULT_IMAGE_CACHE_MB,
+    DEFAULT_LOCATION_CACHE_SIZE,
+    DEFAULT_LOCATION_CACHE_TTL,
+    DiskImageCache,
+    ImageCache,
+    LocationCache,
+)
+from events import ParticipantEvents
+from images import (
+    DEFAULT_MAX_UPLOAD_MB,
+    IMAGE_CACHE_CONTROL,
+    MAX_BATCH_BYTES,
+    PROVISIONAL_CACHE_CONTROL,
+    THUMBNAIL_SIZES,
+    backfill_thumbnails,
+    create_qr_code,
+    discard_upload,
+    file_lengths,
+    image_etag,
+    iter_grid_out,
+    migrate_inline_images,
+    read_files,
+    select_rendition,
+    store_upload,
+)
+from indexes import IndexCheck, backfill_indexed_fields, ensure_indexes, index_report
+from logging_setup import configure_logging, parse_sample_rates
+from lookup import DEFAULT_LOOKUP_LIMIT, ParticipantLookup
+from participants import (
+    MAX_PAGE_SIZE,
+    STREAM_BATCH_SIZE,
+    build_filter,
+    find_participants,
+    paginate_participants,
+    parse_fields,
+    parse_page_size,
+    search_fields,
+    serialize_participant,
+)
+from stats import (
+    IN_CAMPUS,
+    NOT_ENTERED,
+    OUTSIDE_CAMPUS,
+    read_counters,
+    reconcile_counters,
+    record_insert,
+    record_transition,
+    record_transitions,
+    reset_counters,
+)
 
 # Load environment variables from .env file
 load_dotenv(override=True)
 
+class AppRequest(Request):
+    """
+    Request that allows much larger bodies on the bulk import route only.
+    """
+
+    @property
+    def max_content_length(self):
+        if self.endpoint == "bulk_import_participants":
+            return int(os.getenv("MAX_IMPORT_MB", DEFAULT_MAX_IMPORT_MB)) * 1024 * 1024
+        return super().max_content_length
+
+
 app = Flask(__name__)
+app.request_class = AppRequest
+# Structured logs written by a background thread; LOG_SAMPLE_RATES thins out busy routes
+configure_logging(
+    app,
+    level=os.getenv("LOG_LEVEL"),
+    json_output=os.getenv("LOG_FORMAT", "json") == "json",
+    sample_rates=parse_sample_rates(os.getenv("LOG_SAMPLE_RATES")),
+)
+# Werkzeug rejects larger request bodies with 413 before they are read
+app.config["MAX_CONTENT_LENGTH"] = (
+    int(os.getenv("MAX_UPLOAD_MB", DEFAULT_MAX_UPLOAD_MB)) * 1024 * 1024
+)
 
 # MongoDB connection
 CONNECTION_STRING = os.getenv("MONGO_URI")
@@ -20,6 +115,38 @@ client = MongoClient(CONNECTION_STRING)
 db = client["Kurukshetra"]  # Database namb
 fs = GridFS(db)
 collection = db["Participants"]  # Collection name
+stats_collection = db["Stats"]  # Live occupancy counters
+image_hashes = db["ImageHashes"]  # Photo SHA-256 -> GridFS files, for deduplication
+
+# Per-worker cache of hot photos; IMAGE_CACHE_MB=0 disables it
+image_cache = ImageCache(
+    int(os.getenv("IMAGE_CACHE_MB", DEFAULT_IMAGE_CACHE_MB)) * 1024 * 1024
+)
+# (participant id, size) -> (file id, mimetype), so image requests can skip
+# the Participants lookup
+image_locations = LocationCache(
+    int(os.getenv("IMAGE_LOCATION_CACHE_SIZE", DEFAULT_LOCATION_CACHE_SIZE)),
+    int(os.getenv("IMAGE_LOCATION_CACHE_TTL", DEFAULT_LOCATION_CACHE_TTL)),
+)
+# $text fails without the search_text index, which only the CLI creates
+text_index_ready = IndexCheck(collection, "search_text")
+# Typeahead index for the gate lookup, built on first use
+lookup_index = ParticipantLookup()
+# One change-stream tailer per worker, shared by every open dashboard
+participant_events = ParticipantEvents(
+    collection, stats_collection, lambda: read_counters(collection, stats_collection)
+)
+# Optional host-wide cache of photo files, served with sendfile
+disk_cache = None
+if os.getenv("IMAGE_DISK_CACHE_DIR"):
+    disk_cache = DiskImageCache(
+        os.getenv("IMAGE_DISK_CACHE_DIR"),
+        int(os.getenv("IMAGE_DISK_CACHE_MB", DEFAULT_DISK_CACHE_MB)) * 1024 * 1024,
+    )
+
+if os.getenv("CREATE_INDEXES_ON_STARTUP") == "1":
+    for name, error in ensure_indexes(collection).items():
+        app.logger.warning("Could not create index %s: %s", name, error)
 
 
 @app.route("/")
@@ -42,17 +169,32 @@ def upload_image():
     phone_number = request.form.get("phone", "000-000-0000")
 
     try:
-        image_binary = file.read()
+        image_fields, image_created = store_upload(fs, image_hashes, file)
+
+        # Allocate the id up front so the check-in QR code goes in with the insert
+        participant_id = ObjectId()
+        qr_id = create_qr_code(fs, participant_id)
 
         participant_data = {
-            "filename": file.filename,
-            "data": image_binary,
+            "_id": participant_id,
+            "qr_id": qr_id,
+            **image_fields,
             "name": participant_name,
             "email": email,
             "phone": phone_number,
-            "status": "Not Entered Yet",  # Default status
+            **search_fields(participant_name, email, phone_number),
+            "status": NOT_ENTERED,  # Default status
+            "updated_at": datetime.now(timezone.utc),
         }
-        result = collection.insert_one(participant_data)
+        try:
+            result = collection.insert_one(participant_data)
+        except DuplicateKeyError:
+            fs.delete(qr_id)
+            if image_created:
+                discard_upload(fs, image_hashes, image_fields)
+            return jsonify({"error": "Email already registered"}), 409
+        record_insert(collection, stats_collection, NOT_ENTERED)
+        lookup_index.add(participant_data)
 
         # Redirect to confirmation page
         return redirect(
@@ -63,6 +205,52 @@ def upload_image():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/import", methods=["POST"])
+def bulk_import_participants():
+    """
+    Route to register many participants at once from a CSV file ("csv")
+    with name, email, phone and photo columns, plus an optional ZIP of the
+    photos ("photos"). Returns counts and the errors of rejected rows; if the
+    file turns out to be unreadable partway, the rows imported before that
+    are reported along with the error.
+    """
+    if "csv" not in request.files:
+        return jsonify({"error": "No CSV file provided"}), 400
+    inserted, errors = 0, []
+    try:
+        archive = open_archive(request.files["photos"]) if "photos" in request.files else None
+        rows = read_rows(io.TextIOWrapper(request.files["csv"].stream, "utf-8-sig", newline=""))
+        for batch in import_participants(
+            collection, fs, image_hashes, rows, archive,
+            max_photo_bytes=app.config["MAX_CONTENT_LENGTH"],
+        ):
+            record_imported(batch["inserted"])
+            inserted += len(batch["inserted"])
+            errors.extend(batch["errors"])
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify(
+            {"error": str(e), "inserted": inserted, "failed": len(errors), "errors": errors}
+        ), 400
+
+    return jsonify({"inserted": inserted, "failed": len(errors), "errors": errors})
+
+
+def record_imported(participants):
+    """
+    Count and index participants registered by a bulk import.
+    """
+    if not participants:
+        return
+    record_insert(collection, stats_collection, NOT_ENTERED, count=len(participants))
+    for participant in participants:
+        lookup_index.add(participant)
+
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({"error": "File is too large"}), 413
+
+
 @app.route("/participant/<participant_id>", methods=["GET"])
 def participant_details(participant_id):
     """
@@ -84,48 +272,415 @@ def participant_details(participant_id):
 def update_status(participant_id):
     """
     Route to update the status of a participant.
+    Clients sending JSON or asking for it (Accept: application/json) get the
+    new status and live counters back instead of a redirect to the dashboard.
     """
-    status = request.form["status"]
+    wants_json = request.is_json or request.accept_mimetypes.best == "application/json"
+    if request.is_json:
+        status = (request.get_json(silent=True) or {}).get("status")
+    else:
+        status = request.form["status"]
 
     try:
         # Validate the status
-        if status not in ["In Campus", "Outside Campus"]:
+        if status not in [IN_CAMPUS, OUTSIDE_CAMPUS]:
             return jsonify({"error": "Invalid status"}), 400
 
-        collection.update_one(
-            {"_id": ObjectId(participant_id)}, {"$set": {"status": status}}
+        previous = collection.find_one_and_update(
+            {"_id": ObjectId(participant_id)},
+            {"$set": {"status": status, "updated_at": datetime.now(timezone.utc)}},
+            projection={"status": 1},
+        )
+        if previous:
+            status_changed(participant_id, previous.get("status"), status)
+        if not wants_json:
+            return redirect(url_for("dashboard"))
+        if not previous:
+            return jsonify({"error": "Participant not found"}), 404
+        return jsonify(
+            {
+                "_id": participant_id,
+                "status": status,
+                "stats": read_counters(collection, stats_collection),
+            }
         )
-        return redirect(url_for("dashboard"))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-import io
-from flask import send_file, jsonify
-from bson.objectid import ObjectId
+def status_changed(participant_id, old_status, new_status):
+    # Keep this worker's derived state in step with a status write
+    record_transition(collection, stats_collection, old_status, new_status)
+    lookup_index.set_status(participant_id, new_status)
+
+
+@app.route("/checkin/<token>", methods=["POST"])
+def checkin(token):
+    """
+    Route for QR scanners: the token is the participant id encoded in their QR code.
+    Toggles the participant between In Campus and Outside Campus, or sets
+    ?status= explicitly, with a single write.
+    """
+    status = request.values.get("status")
+    if status is not None and status not in [IN_CAMPUS, OUTSIDE_CAMPUS]:
+        return jsonify({"error": "Invalid status"}), 400
+
+    try:
+        participant_id = ObjectId(token)
+    except InvalidId:
+        return jsonify({"error": "Invalid check-in token"}), 400
+
+    if status is None:
+        # Anyone not inside (including first arrivals) is checked in
+        status = {
+            "$cond": [{"$eq": ["$status", IN_CAMPUS]}, OUTSIDE_CAMPUS, IN_CAMPUS]
+        }
+    previous = collection.find_one_and_update(
+        {"_id": participant_id},
+        [{"$set": {"status": status, "updated_at": "$$NOW"}}],
+        projection={"name": 1, "status": 1},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if not previous:
+        return jsonify({"error": "Participant not found"}), 404
+
+    old_status = previous.get("status")
+    if isinstance(status, dict):
+        status = OUTSIDE_CAMPUS if old_status == IN_CAMPUS else IN_CAMPUS
+    status_changed(token, old_status, status)
+    return jsonify({"_id": token, "name": previous.get("name"), "status": status})
+
+
+MAX_BULK_STATUS_UPDATES = 1000
+# Recent bulk write ids kept on each participant, see api_bulk_status()
+STATUS_BATCH_HISTORY = 8
+
+
+@app.route("/api/status", methods=["POST"])
+def api_bulk_status():
+    """
+    Route to move many participants at once, e.g. a whole bus or team.
+    Takes JSON {"ids": [...], "status": ...} or {"updates": [{"_id", "status"}, ...]}
+    and applies every change with one bulk_write. Returns a result per id
+    (updated, unchanged, not_found, conflict or an invalid_* error) and the
+    live counters.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    if "updates" in body:
+        updates = body["updates"]
+    else:
+        updates = body.get("ids")
+        if isinstance(updates, list):
+            updates = [{"_id": value, "status": body.get("status")} for value in updates]
+    if not isinstance(updates, list):
+        return jsonify({"error": "ids or updates must be a list"}), 400
+    if not updates:
+        return jsonify({"error": "No updates provided"}), 400
+    if len(updates) > MAX_BULK_STATUS_UPDATES:
+        return jsonify({"error": f"At most {MAX_BULK_STATUS_UPDATES} updates per request"}), 400
+
+    results = []
+    targets = {}  # ObjectId -> (result, target status)
+    for update in updates:
+        raw_id = str(update.get("_id")) if isinstance(update, dict) else None
+        result = {"_id": raw_id}
+        results.append(result)
+        status = update.get("status") if isinstance(update, dict) else None
+        if status not in [IN_CAMPUS, OUTSIDE_CAMPUS]:
+            result["result"] = "invalid_status"
+            continue
+        try:
+            participant_id = ObjectId(raw_id)
+        except (InvalidId, TypeError):
+            result["result"] = "invalid_id"
+            continue
+        if participant_id in targets:
+            result["result"] = "duplicate"
+            continue
+        targets[participant_id] = (result, status)
+
+    previous = {
+        participant["_id"]: participant.get("status")
+        for participant in collection.find({"_id": {"$in": list(targets)}}, {"status": 1})
+    }
+    now = datetime.now(timezone.utc)
+    # Tags every row this request writes. Other writers leave the array
+    # alone (and later bulk writes only append to it), so unlike status or
+    # updated_at it still shows our write after someone else's
+    batch_id = ObjectId()
+    operations, pending = [], {}
+    for participant_id, (result, status) in targets.items():
+        if participant_id not in previous:
+            result["result"] = "not_found"
+        elif previous[participant_id] == status:
+            result.update(result="unchanged", status=status)
+        else:
+            # Only applies if nobody changed the status since it was read,
+            # so the counters can be moved by exactly what was written
+            operations.append(
+                UpdateOne(
+                    {"_id": participant_id, "status": previous[participant_id]},
+                    {
+                        "$set": {"status": status, "updated_at": now},
+                        "$push": {
+                            "status_batches": {
+                                "$each": [batch_id],
+                                "$slice": -STATUS_BATCH_HISTORY,
+                            }
+                        },
+                    },
+                )
+            )
+            pending[participant_id] = (result, status)
+
+    applied = set(pending)
+    if operations:
+        written = collection.bulk_write(operations, ordered=False)
+        if written.matched_count < len(operations):
+            # Some rows changed underneath us; keep exactly those we wrote
+            applied = {
+                participant["_id"]
+                for participant in collection.find(
+                    {"_id": {"$in": list(pending)}, "status_batches": batch_id}, {"_id": 1}
+                )
+            }
+
+    transitions = {}
+    for participant_id, (result, status) in pending.items():
+        if participant_id not in applied:
+            result["result"] = "conflict"
+            continue
+        result.update(result="updated", status=status)
+        key = (previous[participant_id], status)
+        transitions[key] = transitions.get(key, 0) + 1
+        lookup_index.set_status(participant_id, status)
+    record_transitions(collection, stats_collection, transitions)
+
+    return jsonify(
+        {"results": results, "stats": read_counters(collection, stats_collection)}
+    )
+
+
+RENDITION_PROJECTION = {"image_id": 1, "content_type": 1, "filename": 1, "thumbnails": 1}
+
+
+def remember_location(participant, size, location):
+    # A thumbnail request served by the original is not cached, so the
+    # thumbnail is picked up as soon as it is generated
+    if size is None or location[0] != participant["image_id"]:
+        image_locations.put((str(participant["_id"]), size), location)
+
 
 @app.route("/image/<participant_id>", methods=["GET"])
 def get_image(participant_id):
-    # Find the participant document by ID
-    participant = collection.find_one({'_id': ObjectId(participant_id)})
-    
-    if not participant or 'image_id' not in participant or not participant['image_id']:
-        return jsonify({"error": "Image not found"}), 404
+    """
+    Route streaming a participant's photo from GridFS, with support for Range requests.
+    Pass ?size=<name> to get one of the THUMBNAIL_SIZES renditions instead.
+    """
+    size = request.args.get("size")
+    if size is not None and size not in THUMBNAIL_SIZES:
+        return jsonify({"error": "Unknown image size"}), 400
+
+    # Only thumbnails are location-cached, so a cache hit is never a fallback
+    location = image_locations.get((participant_id, size))
+    fallback = False
+    if location is None:
+        try:
+            participant = collection.find_one(
+                {"_id": ObjectId(participant_id)}, RENDITION_PROJECTION
+            )
+        except InvalidId:
+            return jsonify({"error": "Invalid ObjectId format"}), 400
+
+        if not participant or not participant.get("image_id"):
+            return jsonify({"error": "Image not found"}), 404
+
+        location = select_rendition(participant, size)
+        remember_location(participant, size, location)
+        fallback = size is not None and location[0] == participant["image_id"]
+
+    image_id, mimetype = location
+    etag = image_etag(image_id)
+    # The original standing in for a missing thumbnail must not be kept for
+    # a year under the thumbnail URL
+    cache_control = PROVISIONAL_CACHE_CONTROL if fallback else IMAGE_CACHE_CONTROL
+    headers = {"Cache-Control": cache_control, "ETag": f'"{etag}"'}
+
+    # Revalidation is answered without touching GridFS
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+
+    grid_out = None
+    cached = image_cache.get(image_id)
+    if cached is None and disk_cache:
+        path = disk_cache.get(image_id)
+        if path:
+            try:
+                return send_cached_image(path, mimetype, etag, cache_control)
+            except FileNotFoundError:
+                pass  # Evicted by another worker since the lookup
+
+    if cached is None:
+        try:
+            grid_out = fs.get(image_id)
+        except Exception as e:
+            # Provide more information in the error message
+            return jsonify({"error": f"Image retrieval failed: {str(e)}"}), 500
+
+        if image_cache.accepts(grid_out.length):
+            cached = image_cache.put(image_id, grid_out.read(), mimetype)
+            grid_out.close()
+            grid_out = None
+            if disk_cache and disk_cache.accepts(len(cached.data)):
+                disk_cache.put(image_id, [cached.data])
+        elif disk_cache and disk_cache.accepts(grid_out.length):
+            path = disk_cache.put(image_id, iter_grid_out(grid_out, 0, grid_out.length))
+            return send_cached_image(path, mimetype, etag, cache_control)
+
+    length = len(cached.data) if cached else grid_out.length
+    start, stop, status = 0, length, 200
+    headers["Accept-Ranges"] = "bytes"
+
+    # Only single byte ranges are honoured; anything else gets the whole file.
+    # A stale If-Range validator also means the client wants the whole file.
+    if_range = request.if_range
+    range_is_current = not if_range.etag or if_range.etag == etag
+    if request.range and len(request.range.ranges) == 1 and range_is_current:
+        byte_range = request.range.range_for_length(length)
+        if byte_range is None:
+            if grid_out:
+                grid_out.close()
+            return Response(status=416, headers={"Content-Range": f"bytes */{length}"})
+        start, stop = byte_range
+        status = 206
+        headers["Content-Range"] = ContentRange("bytes", start, stop, length).to_header()
+
+    headers["Content-Length"] = str(stop - start)
+    if cached:
+        return Response(
+            cached.data[start:stop],
+            status=status,
+            mimetype=cached.content_type,
+            headers=headers,
+        )
+    return Response(
+        iter_grid_out(grid_out, start, stop),
+        status=status,
+        mimetype=mimetype,
+        headers=headers,
+        direct_passthrough=True,
+    )
+
 
+@app.route("/images", methods=["GET"])
+def get_images_batch():
+    """
+    Route returning the photos of many participants in one JSON response.
+    Takes ?ids=<id>,<id>,... and an optional ?size= (default "thumb").
+    """
+    size = request.args.get("size", "thumb")
+    if size not in THUMBNAIL_SIZES:
+        return jsonify({"error": "Unknown image size"}), 400
+
+    raw_ids = [value for value in request.args.get("ids", "").split(",") if value]
+    if len(raw_ids) > MAX_PAGE_SIZE:
+        return jsonify({"error": f"At most {MAX_PAGE_SIZE} ids per request"}), 400
     try:
-        # Retrieve the image from GridFS using the image_id stored in the participant document
-        grid_out = fs.get(participant['image_id'])
-        return send_file(
-            io.BytesIO(grid_out.read()),
-            mimetype=grid_out.content_type,
-            as_attachment=False,
-            download_name=grid_out.filename
+        ids = [ObjectId(value) for value in raw_ids]
+    except InvalidId:
+        return jsonify({"error": "Invalid ObjectId format"}), 400
+
+    # Only real thumbnails are bundled; anything else is left to the client,
+    # which loads it from /image/<id> on its own
+    selected = {}
+    unresolved = []
+    for value, participant_id in zip(raw_ids, ids):
+        location = image_locations.get((value, size))
+        if location:
+            selected[value] = location
+        else:
+            unresolved.append(participant_id)
+    if unresolved:
+        participants = collection.find(
+            {"_id": {"$in": unresolved}, "image_id": {"$ne": None}}, RENDITION_PROJECTION
         )
-    except Exception as e:
-        # Provide more information in the error message
-        return jsonify({"error": f"Image retrieval failed: {str(e)}"}), 500
+        for participant in participants:
+            location = select_rendition(participant, size)
+            remember_location(participant, size, location)
+            if location[0] != participant["image_id"]:
+                selected[str(participant["_id"])] = location
+
+    # The bundle only changes if one of its files does
+    etag = hashlib.sha1(
+        ",".join(str(selected.get(value, ("",))[0]) for value in raw_ids).encode()
+    ).hexdigest()
+    complete = len(selected) == len(raw_ids)
+    headers = {
+        "Cache-Control": IMAGE_CACHE_CONTROL if complete else PROVISIONAL_CACHE_CONTROL,
+        "ETag": f'"{etag}"',
+    }
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+
+    # Serve what the image cache holds, then read the rest in one query,
+    # stopping once the response would grow past MAX_BATCH_BYTES
+    files = {}
+    file_mimetypes = dict(selected.values())
+    for image_id in file_mimetypes:
+        cached = image_cache.get(image_id)
+        if cached:
+            files[image_id] = cached.data
+    budget = MAX_BATCH_BYTES - sum(len(data) for data in files.values())
+    lengths = file_lengths(db["fs.files"], [i for i in file_mimetypes if i not in files])
+    missing = []
+    for image_id in file_mimetypes:
+        if image_id in lengths and lengths[image_id] <= budget:
+            missing.append(image_id)
+            budget -= lengths[image_id]
+    for image_id, data in read_files(db["fs.chunks"], missing).items():
+        files[image_id] = image_cache.put(image_id, data, file_mimetypes[image_id]).data
+
+    images = {}
+    for value in raw_ids:
+        image_id, mimetype = selected.get(value, (None, None))
+        if image_id not in files:
+            images[value] = None
+            continue
+        images[value] = {
+            "content_type": mimetype,
+            "etag": image_etag(image_id),
+            "data": base64.b64encode(files[image_id]).decode("ascii"),
+        }
+    if None in images.values():
+        headers["Cache-Control"] = PROVISIONAL_CACHE_CONTROL
+
+    response = jsonify({"images": images})
+    response.headers.update(headers)
+    return response
+
+
+def send_cached_image(path, mimetype, etag, cache_control=IMAGE_CACHE_CONTROL):
+    # send_file hands the open file to the server's sendfile path and
+    # handles Range/If-Range against our ETag
+    response = send_file(path, mimetype=mimetype, etag=etag, conditional=True)
+    response.headers["Cache-Control"] = cache_control
+    return response
 
 
+@app.route("/api/image-cache", methods=["GET"])
+def image_cache_stats():
+    """
+    Route reporting this worker's image cache usage and hit rate.
+    """
+    return jsonify(
+        {
+            "memory": image_cache.stats(),
+            "disk": disk_cache.stats() if disk_cache else None,
+            "locations": image_locations.stats(),
+        }
+    )
 
 
 @app.route("/wipe", methods=["GET", "POST"])
@@ -135,6 +690,9 @@ def wipe_database():
     """
     if request.method == "POST":
         collection.delete_many({})
+        reset_counters(stats_collection)
+        image_locations.clear()
+        lookup_index.clear()
         return redirect(url_for("main"))
 
     return render_template("wipe_page.html", error=None)
@@ -142,35 +700,299 @@ def wipe_database():
 
 @app.route("/user_added/<participant_id>", methods=["GET"])
 def user_added_confirmation(participant_id):
-    return render_template("user_added.html", participant_id=participant_id)
+    qr_code = None
+    try:
+        participant = collection.find_one({"_id": ObjectId(participant_id)}, {"qr_id": 1})
+    except InvalidId:
+        participant = None
+    if participant and not participant.get("qr_id"):
+        # Bulk imports leave QR codes to be rendered on first view
+        participant["qr_id"] = create_qr_code(fs, participant["_id"])
+        collection.update_one(
+            {"_id": participant["_id"]}, {"$set": {"qr_id": participant["qr_id"]}}
+        )
+    if participant:
+        qr_code = base64.b64encode(fs.get(participant["qr_id"]).read()).decode("ascii")
+    return render_template(
+        "user_added.html", participant_id=participant_id, qr_code=qr_code
+    )
 
 
 @app.route("/dashboard", methods=["GET"])
 def dashboard():
     """
-    Route to view the dashboard with all participants.
+    Route to view the dashboard, one page of participants at a time.
+    ?q= searches names, emails and phone numbers on the server.
+    ?view=all streams every matching participant instead of a single page.
     """
-    participants = list(collection.find())
-    in_campus = collection.count_documents({"status": "In Campus"})
-    outside_campus = collection.count_documents({"status": "Outside Campus"})
-    total_participants = len(participants)
+    per_page = parse_page_size(request.args.get("per_page"))
+    search = request.args.get("q", "").strip()
+    query = build_filter(search=search, text_search=text_index_ready())
+    stats = read_counters(collection, stats_collection)
+    context = {
+        "in_campus": stats["by_status"][IN_CAMPUS],
+        "outside_campus": stats["by_status"][OUTSIDE_CAMPUS],
+        "total_participants": stats["total"],
+        "per_page": per_page,
+        "search": search,
+    }
+
+    if request.args.get("view") == "all":
+        # Rows are rendered as the cursor yields them, so the header reaches
+        # the browser right away and memory stays flat however large the roster
+        cursor = (
+            find_participants(collection, query)
+            .sort("_id", 1)
+            .batch_size(STREAM_BATCH_SIZE)
+        )
+        return stream_template(
+            "dashboard.html",
+            participants=(with_image_url(participant) for participant in cursor),
+            streamed=True,
+            prev_token=None,
+            next_token=None,
+            **context,
+        )
 
-    # Add a URL to fetch the image for each participant
-    for participant in participants:
-        if "image_id" in participant and participant["image_id"]:
-            participant["_image_url"] = url_for("get_image", participant_id=str(participant["_id"]))
-        else:
-            participant["_image_url"] = None  # Set to None if no image is available
-        print(participant)
+    try:
+        page = paginate_participants(
+            collection,
+            after=request.args.get("after"),
+            before=request.args.get("before"),
+            per_page=per_page,
+            query=query,
+        )
+    except InvalidId:
+        return jsonify({"error": "Invalid page token"}), 400
+
+    for participant in page["participants"]:
+        with_image_url(participant)
+    app.logger.debug(
+        "Rendering dashboard page",
+        extra={"participants": len(page["participants"]), "search": search or None},
+    )
     return render_template(
         "dashboard.html",
-        participants=participants,
-        in_campus=in_campus,
-        outside_campus=outside_campus,
-        total_participants=total_participants,
+        participants=page["participants"],
+        streamed=False,
+        prev_token=page["prev_token"],
+        next_token=page["next_token"],
+        **context,
+    )
+
+
+def with_image_url(participant):
+    """
+    Add the URL of the participant's thumbnail, or None if they have no photo.
+    """
+    if participant.get("image_id"):
+        participant["_image_url"] = url_for(
+            "get_image", participant_id=str(participant["_id"]), size="thumb"
+        )
+    else:
+        participant["_image_url"] = None
+    return participant
+
+
+@app.route("/api/participants", methods=["GET"])
+def api_participants():
+    """
+    Route listing participants as JSON, one keyset page at a time.
+    Supports ?fields=, ?status=, ?q= (indexed search), ?after=/?before= cursors
+    and ?limit=. With ?format=ndjson every matching row after the cursor is
+    streamed as newline-delimited JSON instead.
+    """
+    try:
+        fields = parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    query = build_filter(
+        request.args.get("status"), request.args.get("q"), text_index_ready()
+    )
+    after = request.args.get("after")
+
+    if request.args.get("format") == "ndjson":
+        try:
+            if after:
+                query["_id"] = {"$gt": ObjectId(after)}
+        except InvalidId:
+            return jsonify({"error": "Invalid cursor"}), 400
+        cursor = find_participants(collection, query, fields).sort("_id", 1)
+        if request.args.get("limit"):
+            cursor = cursor.limit(parse_page_size(request.args.get("limit")))
+
+        def generate():
+            for participant in cursor:
+                yield json.dumps(serialize_participant(participant)) + "\n"
+
+        return Response(generate(), mimetype="application/x-ndjson")
+
+    try:
+        page = paginate_participants(
+            collection,
+            after=after,
+            before=request.args.get("before"),
+            per_page=parse_page_size(request.args.get("limit")),
+            query=query,
+            fields=fields,
+        )
+    except InvalidId:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+    return jsonify(
+        {
+            "participants": [serialize_participant(p) for p in page["participants"]],
+            "next_cursor": page["next_token"],
+            "prev_cursor": page["prev_token"],
+        }
+    )
+
+
+@app.route("/api/lookup", methods=["GET"])
+def api_lookup():
+    """
+    Route for gate typeahead: participants whose name, email or phone starts
+    with ?q=, or whose phone ends with it, served from memory.
+    """
+    limit = min(
+        request.args.get("limit", DEFAULT_LOOKUP_LIMIT, type=int) or DEFAULT_LOOKUP_LIMIT,
+        MAX_PAGE_SIZE,
     )
+    lookup_index.refresh_if_due(collection)
+    return jsonify({"results": lookup_index.search(request.args.get("q", ""), limit)})
 
 
+@app.route("/api/events", methods=["GET"])
+def api_events():
+    """
+    Route streaming participant changes and live counters as Server-Sent Events.
+    Each open stream holds a worker thread, so run with a threaded or
+    gevent worker when many dashboards are connected.
+    """
+    subscriber = participant_events.subscribe()
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                message = subscriber.next(timeout=15)
+                if message is None:
+                    yield ": keepalive\n\n"
+                    continue
+                event, data = message
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                if event == "resync":
+                    return
+        finally:
+            participant_events.unsubscribe(subscriber)
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/api/stats", methods=["GET"])
+def live_stats():
+    """
+    Route returning live occupancy counters for gate displays.
+    """
+    return jsonify(read_counters(collection, stats_collection))
+
+
+@app.cli.command("reconcile-stats")
+def reconcile_stats_command():
+    """Rebuild the occupancy counters from the Participants collection."""
+    counters = reconcile_counters(collection, stats_collection)
+    print(f"Total: {counters['total']}")
+    for status, count in counters["by_status"].items():
+        print(f"{status}: {count}")
+
+
+@app.cli.command("create-indexes")
+def create_indexes_command():
+    """Create the Participants indexes and backfill the fields they cover."""
+    updated = backfill_indexed_fields(collection, datetime.now(timezone.utc))
+    print(f"Backfilled {updated} participants")
+    errors = ensure_indexes(collection)
+    for name, error in errors.items():
+        print(f"Failed to create {name}: {error}")
+    if not errors:
+        print("All indexes are in place")
+
+
+@app.cli.command("check-indexes")
+def check_indexes_command():
+    """Report missing, undeclared and unused Participants indexes."""
+    report = index_report(collection)
+    print(f"Missing: {', '.join(report['missing']) or 'none'}")
+    print(f"Undeclared: {', '.join(report['undeclared']) or 'none'}")
+    if report["unused"] is None:
+        print("Unused: unknown (index usage stats not available)")
+    else:
+        print(f"Unused: {', '.join(report['unused']) or 'none'}")
+
+
+def average_document_size():
+    try:
+        return db.command("collStats", collection.name).get("avgObjSize")
+    except OperationFailure:
+        return None
+
+
+@app.cli.command("migrate-images")
+@click.option("--batch-size", default=100, show_default=True)
+def migrate_images_command(batch_size):
+    """Move inline participant image bytes into GridFS."""
+    print(f"Average document size before: {average_document_size()} bytes")
+    for progress in migrate_inline_images(collection, fs, batch_size=batch_size):
+        print(
+            f"Migrated {progress['migrated']} ({progress['failed']} failed), "
+            f"{progress['bytes'] / 1024 / 1024:.1f} MB in {progress['elapsed']:.1f}s, "
+            f"{progress['docs_per_second']:.1f} docs/s"
+        )
+    print(f"Average document size after: {average_document_size()} bytes")
+
+
+@app.cli.command("import-participants")
+@click.argument("csv_file", type=click.File("r", encoding="utf-8-sig"))
+@click.option("--photos", type=click.Path(exists=True, dir_okay=False), help="ZIP of photos.")
+@click.option("--batch-size", default=IMPORT_BATCH_SIZE, show_default=True)
+@click.option("--workers", default=IMPORT_WORKERS, show_default=True)
+def import_participants_command(csv_file, photos, batch_size, workers):
+    """Register participants from a CSV file and an optional ZIP of photos."""
+    try:
+        archive = open_archive(photos) if photos else None
+        rows = read_rows(csv_file)
+        inserted = failed = 0
+        for batch in import_participants(
+            collection, fs, image_hashes, rows, archive, batch_size, workers,
+            max_photo_bytes=app.config["MAX_CONTENT_LENGTH"],
+        ):
+            record_imported(batch["inserted"])
+            inserted += len(batch["inserted"])
+            failed += len(batch["errors"])
+            for error in batch["errors"]:
+                print(f"Row {error['row']}: {error['error']}")
+            print(f"Imported {inserted} participants, {failed} rows failed")
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        # Batches reported above are already in the database
+        raise click.ClickException(str(e))
+
+
+@app.cli.command("generate-thumbnails")
+def generate_thumbnails_command():
+    """Create thumbnails for participant photos uploaded before they existed."""
+    created = skipped = 0
+    for participant_id, ok in backfill_thumbnails(collection, fs):
+        if ok:
+            created += 1
+        else:
+            skipped += 1
+            print(f"Could not create thumbnails for {participant_id}")
+    print(f"Created thumbnails for {created} participants, skipped {skipped}")
+
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,166 @@
+import re
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Documents fetched per round trip when streaming the whole roster
+STREAM_BATCH_SIZE = 500
+
+# Fields needed to list participants. Image bytes are never part of a listing.
+LISTING_FIELDS = ("name", "email", "phone", "status", "image_id")
+
+# Fields API clients may select with ?fields=
+API_FIELDS = LISTING_FIELDS + ("updated_at",)
+
+# Search terms treated as (part of) a phone number
+PHONE_QUERY = re.compile(r"[\d\s()+-]*\d[\d\s()+-]*")
+
+
+def parse_page_size(value):
+    """
+    Clamp the requested page size to a sane range, falling back to the default.
+    """
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def normalize_phone(phone):
+    """
+    Reduce a phone number to its digits so different formats compare equal.
+    """
+    return re.sub(r"\D", "", phone or "")
+
+
+def normalize_text(value):
+    """
+    Lowercase and trim a name or email for case-insensitive prefix search.
+    """
+    return (value or "").strip().lower()
+
+
+def search_fields(name, email, phone):
+    """
+    Derived fields that back the indexed participant search.
+    """
+    return {
+        "name_lower": normalize_text(name),
+        "email_lower": normalize_text(email),
+        "phone_normalized": normalize_phone(phone),
+    }
+
+
+def listing_projection(fields=LISTING_FIELDS):
+    """
+    Build an inclusive projection for the given fields (_id is always returned).
+    """
+    return {field: 1 for field in fields}
+
+
+def find_participants(collection, query=None, fields=LISTING_FIELDS):
+    """
+    Return a cursor over participants that only carries the listed fields.
+    """
+    return collection.find(query or {}, listing_projection(fields))
+
+
+def parse_fields(value):
+    """
+    Turn a ?fields= list into a tuple of API_FIELDS, or raise ValueError.
+    """
+    if not value:
+        return LISTING_FIELDS
+    fields = tuple(field.strip() for field in value.split(",") if field.strip())
+    unknown = [field for field in fields if field not in API_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def build_filter(status=None, search=None, text_search=True):
+    """
+    Build the participants query for the status and search filters.
+
+    The search matches case-insensitive prefixes of name and email, digit
+    prefixes of the phone number, and whole words through the text index.
+    Every clause is index-backed (see indexes.PARTICIPANT_INDEXES). Pass
+    text_search=False when the text index is missing, as $text fails then.
+    """
+    query = {}
+    if status:
+        query["status"] = status
+    term = normalize_text(search)
+    if term:
+        prefix = {"$regex": f"^{re.escape(term)}"}
+        clauses = [{"name_lower": prefix}, {"email_lower": prefix}]
+        if text_search:
+            clauses.append({"$text": {"$search": term}})
+        if PHONE_QUERY.fullmatch(term):
+            digits = normalize_phone(term)
+            clauses.append({"phone_normalized": {"$regex": f"^{digits}"}})
+        query["$or"] = clauses
+    return query
+
+
+def serialize_participant(participant):
+    """
+    Convert a participant document into JSON-safe values.
+    """
+    serialized = {}
+    for key, value in participant.items():
+        if isinstance(value, ObjectId):
+            value = str(value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        serialized[key] = value
+    return serialized
+
+
+def paginate_participants(
+    collection,
+    after=None,
+    before=None,
+    per_page=DEFAULT_PAGE_SIZE,
+    query=None,
+    fields=LISTING_FIELDS,
+):
+    """
+    Fetch one page of participants ordered by _id using keyset pagination.
+
+    `after` and `before` are the string _id of the last/first row of the
+    neighbouring page. Each page is a single range scan on the _id index, so
+    its cost does not grow with the size of the collection. `query` narrows
+    the rows further.
+    """
+    query = dict(query or {})
+    if before:
+        query["_id"] = {"$lt": ObjectId(before)}
+        sort_order = DESCENDING
+    else:
+        if after:
+            query["_id"] = {"$gt": ObjectId(after)}
+        sort_order = ASCENDING
+
+    # Fetch one extra row to find out whether another page exists
+    cursor = find_participants(collection, query, fields).sort("_id", sort_order)
+    rows = list(cursor.limit(per_page + 1))
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if before:
+        rows.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = bool(after), has_more
+
+    return {
+        "participants": rows,
+        "per_page": per_page,
+        "prev_token": str(rows[0]["_id"]) if rows and has_prev else None,
+        "next_token": str(rows[-1]["_id"]) if rows and has_next else None,
+    }
@@ -0,0 +1,110 @@
+IN_CAMPUS = "In Campus"
+OUTSIDE_CAMPUS = "Outside Campus"
+NOT_ENTERED = "Not Entered Yet"
+
+STATUSES = (NOT_ENTERED, IN_CAMPUS, OUTSIDE_CAMPUS)
+
+
+def occupancy_stats(collection):
+    """
+    Count participants per status and in total with a single aggregation.
+
+    Sorting and projecting on `status` alone lets the server answer from the
+    status index instead of fetching whole documents.
+    """
+    pipeline = [
+        {"$sort": {"status": 1}},
+        {"$project": {"_id": 0, "status": 1}},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+    ]
+    total = 0
+    by_status = {status: 0 for status in STATUSES}
+    for row in collection.aggregate(pipeline):
+        total += row["count"]
+        if row["_id"] is not None:
+            by_status[row["_id"]] = row["count"]
+
+    return {"total": total, "by_status": by_status}
+
+
+# Incrementally maintained counters, kept in a single document so that
+# readers get live occupancy with one primary-key lookup.
+COUNTERS_ID = "occupancy"
+
+
+def _normalize(counters):
+    by_status = {status: 0 for status in STATUSES}
+    by_status.update(counters.get("by_status", {}))
+    return {"total": counters.get("total", 0), "by_status": by_status}
+
+
+def _increment(collection, stats_collection, increments):
+    result = stats_collection.update_one({"_id": COUNTERS_ID}, {"$inc": increments})
+    if result.matched_count == 0:
+        # Counting from zero would ignore everyone registered before the
+        # counters existed; the participant write is already in, so a
+        # rebuild includes it
+        reconcile_counters(collection, stats_collection)
+
+
+def record_insert(collection, stats_collection, status, count=1):
+    """
+    Count newly registered participants with the given status.
+    """
+    _increment(
+        collection, stats_collection, {"total": count, f"by_status.{status}": count}
+    )
+
+
+def record_transition(collection, stats_collection, old_status, new_status, count=1):
+    """
+    Move participants from one status bucket to another.
+    """
+    record_transitions(collection, stats_collection, {(old_status, new_status): count})
+
+
+def record_transitions(collection, stats_collection, transitions):
+    """
+    Apply many {(old_status, new_status): count} moves with one counters write.
+    """
+    increments = {}
+    for (old_status, new_status), count in transitions.items():
+        if old_status == new_status or not count:
+            continue
+        key = f"by_status.{new_status}"
+        increments[key] = increments.get(key, 0) + count
+        if old_status is not None:
+            key = f"by_status.{old_status}"
+            increments[key] = increments.get(key, 0) - count
+    increments = {key: value for key, value in increments.items() if value}
+    if not increments:
+        return
+    _increment(collection, stats_collection, increments)
+
+
+def reset_counters(stats_collection):
+    """
+    Zero every counter, e.g. after the participants collection is wiped.
+    """
+    stats_collection.replace_one(
+        {"_id": COUNTERS_ID}, _normalize({}), upsert=True
+    )
+
+
+def reconcile_counters(collection, stats_collection):
+    """
+    Rebuild the counters document from the participants collection.
+    """
+    counters = occupancy_stats(collection)
+    stats_collection.replace_one({"_id": COUNTERS_ID}, counters, upsert=True)
+    return counters
+
+
+def read_counters(collection, stats_collection):
+    """
+    Return live occupancy from the counters document, building it if missing.
+    """
+    counters = stats_collection.find_one({"_id": COUNTERS_ID})
+    if counters is None:
+        return reconcile_counters(collection, stats_collection)
+    return _normalize(counters)
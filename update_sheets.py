@@ -12,6 +12,8 @@ import io
 import time
 from googleapiclient.errors import HttpError  # Import HttpError
 
+from participants import LISTING_FIELDS, find_participants
+
 # Load environment variables
 load_dotenv(override=True)
 
@@ -69,7 +71,9 @@ def upload_to_drive(image_binary, file_name):
 
 # Process new rows and insert them into the sheet
 new_rows = []
-for document in collection.find({}):
+# Deduplicated uploads share one GridFS file, so push each file to Drive once
+drive_links = {}
+for document in find_participants(collection, fields=LISTING_FIELDS + ("event", "role")):
     document_id = str(document["_id"])
     
     # Check if the document is already processed
@@ -88,15 +92,19 @@ for document in collection.find({}):
         image_id = document.get("image_id")
         if image_id:
             try:
-                # Retrieve the image binary data from GridFS
-                grid_out = fs.get(image_id)
-                image_binary = grid_out.read()
-                
-                # Generate a file name for the image
-                file_name = f"{document.get('name', 'unknown')}_{image_id}.png"
-                
-                # Upload the image to Google Drive
-                image_url = upload_to_drive(image_binary, file_name)
+                image_url = drive_links.get(image_id)
+                if image_url is None:
+                    # Retrieve the image binary data from GridFS
+                    grid_out = fs.get(image_id)
+                    image_binary = grid_out.read()
+
+                    # Generate a file name for the image
+                    file_name = f"{document.get('name', 'unknown')}_{image_id}.png"
+
+                    # Upload the image to Google Drive
+                    image_url = upload_to_drive(image_binary, file_name)
+                    if image_url:
+                        drive_links[image_id] = image_url
                 
                 # Add IMAGE formula to the row if upload succeeded
                 if image_url: